@@ -1,73 +1,201 @@
-from datetime import datetime
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import cached_property
+import gc
 from pathlib import Path
-import pickle
+import threading
 
+import msgspec
+import numpy as np
 import pandas as pd
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+class Transaction(msgspec.Struct, gc=False):
+    hash: str
+    timeStamp: str
+    from_: str = msgspec.field(name="from")
+    to: str
+
+
+class NormalTransaction(Transaction):
+    value: str
+    input: str
+    isError: str
+    functionName: str = ""
+
+
+class InternalTransaction(Transaction):
+    value: str
+    isError: str
+
+
+class TokenTransaction(Transaction):
+    value: str
+    tokenName: str
+    tokenSymbol: str
+    tokenDecimal: str
+
+
+class NftTransaction(Transaction):
+    tokenID: str
+    tokenName: str
+    tokenSymbol: str
+
+
+class MultiTokenTransaction(Transaction):
+    tokenID: str
+    tokenValue: str
+    tokenName: str
+    tokenSymbol: str
+
+
+# gc_disabled() is entered from the fetch worker threads, so the first
+# entry pauses GC and the last exit restores it
+_gc_lock = threading.Lock()
+_gc_pauses = 0
+_gc_was_enabled = False
+
+
+@contextmanager
+def gc_disabled():
+    # decoding builds many small objects, pause cyclic GC while it runs
+    global _gc_pauses, _gc_was_enabled
+    with _gc_lock:
+        if _gc_pauses == 0:
+            _gc_was_enabled = gc.isenabled()
+            gc.disable()
+        _gc_pauses += 1
+    try:
+        yield
+    finally:
+        with _gc_lock:
+            _gc_pauses -= 1
+            if _gc_pauses == 0 and _gc_was_enabled:
+                gc.enable()
 
 
 class EtherscanData:
+    # attribute name -> Etherscan account action
+    tx_actions = {
+        "txs": "txlist",
+        "internal_txs": "txlistinternal",
+        "token_txs": "tokentx",
+        "nft_txs": "tokennfttx",
+        "erc1155_txs": "token1155tx",
+    }
+
     def __init__(self, address: str, api_key: str,
                  etherscan_url: str = "https://api.etherscan.io/api"):
         self.api_key = api_key
         self.address = address
         self.etherscan_url = etherscan_url
         self.etherscan = EtherscanDataRetriever(api_key)
-        self.load_transactions()
 
-    def load_transactions(self):
-        # transactions
+    def get_transactions(self, action: str):
         params = {
             "module": "account",
-            "action": "txlist",
+            "action": action,
             "address": self.address,
             "startblock": 0,
             "endblock": 99999999,
             "sort": "asc",
             "apikey": self.api_key
         }
-        txs_list = self.etherscan.get_data(params)
-        self.txs = txs_list
+        return self.etherscan.get_data(params)
+
+    @cached_property
+    def txs(self):
+        return self.get_transactions(self.tx_actions["txs"])
+
+    @cached_property
+    def internal_txs(self):
+        return self.get_transactions(self.tx_actions["internal_txs"])
 
-        # internal transactions
-        params["action"] = "txlistinternal"
-        internal_txs_list = self.etherscan.get_data(params)
-        self.internal_txs = internal_txs_list
+    @cached_property
+    def token_txs(self):
+        return self.get_transactions(self.tx_actions["token_txs"])
 
-        # erc20 token transactions
-        params["action"] = "tokentx"
-        token_txs_list = self.etherscan.get_data(params)
-        self.token_txs = token_txs_list
+    @cached_property
+    def nft_txs(self):
+        return self.get_transactions(self.tx_actions["nft_txs"])
 
-        # erc721 token transactions
-        params["action"] = "tokennfttx"
-        nft_txs_list = self.etherscan.get_data(params)
-        self.nft_txs = nft_txs_list
+    @cached_property
+    def erc1155_txs(self):
+        return self.get_transactions(self.tx_actions["erc1155_txs"])
 
-        # erc1155 token transactions
-        params["action"] = "token1155tx"
-        erc155_txs_list = self.etherscan.get_data(params)
-        self.erc1155_txs = erc155_txs_list
+    def load_transactions(self):
+        # fetch all categories not loaded yet concurrently
+        names = [name for name in self.tx_actions if name not in vars(self)]
+        if not names:
+            return
+        actions = [self.tx_actions[name] for name in names]
+        with ThreadPoolExecutor(max_workers=len(actions)) as executor:
+            results = executor.map(self.get_transactions, actions)
+            for name, result in zip(names, results):
+                setattr(self, name, result)
 
     @property
     def all_txs(self):
+        self.load_transactions()
         return (self.txs + self.internal_txs + self.token_txs
                 + self.nft_txs + self.erc1155_txs)
 
+    @staticmethod
+    def group_by_hash(txs):
+        grouped = defaultdict(list)
+        for tx in txs:
+            grouped[tx.hash].append(tx)
+        return grouped
+
+    @cached_property
+    def txs_by_hash(self):
+        return self.group_by_hash(self.txs)
+
+    @staticmethod
+    def make_txs_df(txs, columns=()):
+        columns = ["hash", "from_", "to", "value", *columns]
+        data = pd.DataFrame({column: [getattr(tx, column) for tx in txs]
+                             for column in columns})
+        data = data.rename(columns={"from_": "from_address",
+                                    "to": "to_address"})
+        data = data.set_index("hash", drop=False)
+        return data.sort_index(kind="stable")
+
+    @cached_property
+    def internal_txs_df(self):
+        data = self.make_txs_df(self.internal_txs)
+        data["value_eth"] = data["value"].astype(float) / 10.0 ** 18
+        return data
+
+    @cached_property
+    def token_txs_df(self):
+        data = self.make_txs_df(
+            self.token_txs, ["tokenName", "tokenSymbol", "tokenDecimal"])
+        decimals = data["tokenDecimal"].astype(int)
+        data["value_f"] = (data["value"].astype(float)
+                           / np.power(10.0, decimals))
+        return data
+
     def get_summary(self, prefix: str = ""):
-        hashes = set()
-        hashes_with_ts = []
+        # first timestamp seen for every hash, in first-seen order
+        timestamps = {}
+        set_default = timestamps.setdefault
         for tx in self.all_txs:
-            if tx["hash"] in hashes:
-                continue
-            hashes.add(tx["hash"])
-            hashes_with_ts.append((tx["hash"], int(tx["timeStamp"])))
-        hashes_with_ts = sorted(hashes_with_ts, key=lambda x: x[1])
-
-        data = pd.DataFrame.from_records(hashes_with_ts,
-                                         columns=["hash", "timestamp"])
-        data["datetime"] = data["timestamp"].apply(datetime.fromtimestamp)
-        data["date"] = data["datetime"].apply(datetime.date)
+            set_default(tx.hash, tx.timeStamp)
+        hashes = np.fromiter(timestamps.keys(), dtype=object,
+                             count=len(timestamps))
+        timestamps = np.fromiter(timestamps.values(), dtype=np.int64,
+                                 count=len(timestamps))
+        order = np.argsort(timestamps, kind="stable")
+
+        data = pd.DataFrame({"hash": hashes[order],
+                             "timestamp": timestamps[order]})
+        data["datetime"] = pd.to_datetime(data["timestamp"], unit="s")
+        data["date"] = data["datetime"].dt.date
         if prefix:
             normal = f"{prefix}_normal"
             has_internal = f"{prefix}_has_internal"
@@ -80,29 +208,14 @@ class EtherscanData:
             erc20 = "erc20"
             erc721 = "erc721"
             erc1155 = "erc1155"
-        data[normal] = 0
-        data[has_internal] = 0
-        data[erc20] = 0
-        data[erc721] = 0
-        data[erc1155] = 0
-
-        for tx in self.txs:
-            n_txs = len([a for a in self.txs if a["hash"] == tx["hash"]])
-            data.loc[data["hash"] == tx["hash"], normal] = n_txs
-        for tx in self.internal_txs:
-            n_txs = len([a for a in self.internal_txs
-                         if a["hash"] == tx["hash"]])
-            data.loc[data["hash"] == tx["hash"], has_internal] = n_txs
-        for tx in self.token_txs:
-            n_txs = len([a for a in self.token_txs if a["hash"] == tx["hash"]])
-            data.loc[data["hash"] == tx["hash"], erc20] = n_txs
-        for tx in self.nft_txs:
-            n_txs = len([a for a in self.nft_txs if a["hash"] == tx["hash"]])
-            data.loc[data["hash"] == tx["hash"], erc721] = n_txs
-        for tx in self.erc1155_txs:
-            n_txs = len([a for a in self.erc1155_txs
-                         if a["hash"] == tx["hash"]])
-            data.loc[data["hash"] == tx["hash"], erc1155] = n_txs
+        columns = [(normal, self.txs),
+                   (has_internal, self.internal_txs),
+                   (erc20, self.token_txs),
+                   (erc721, self.nft_txs),
+                   (erc1155, self.erc1155_txs)]
+        for column, txs in columns:
+            n_txs = Counter(tx.hash for tx in txs)
+            data[column] = data["hash"].map(n_txs).fillna(0).astype("int32")
         return data
 
 
@@ -114,46 +227,77 @@ class EtherscanDataRetriever:
         self.etherscan_url = etherscan_url
         self.cache_path = Path(cache_path)
         self.cache_path.mkdir(parents=True, exist_ok=True)
-        self.account_actions = ["txlist", "txlistinternal",
-                                "tokentx", "tokennfttx", "token1155tx"]
+        # account action -> record type of its result
+        self.account_tx_types = {
+            "txlist": NormalTransaction,
+            "txlistinternal": InternalTransaction,
+            "tokentx": TokenTransaction,
+            "tokennfttx": NftTransaction,
+            "token1155tx": MultiTokenTransaction,
+        }
+        self.account_actions = frozenset(self.account_tx_types)
+        self.encoder = msgspec.msgpack.Encoder()
+        # str covers Etherscan error messages cached by older versions
+        self.decoders = {
+            action: msgspec.msgpack.Decoder(list[tx_type] | str)
+            for action, tx_type in self.account_tx_types.items()
+        }
+        self.json_decoder = msgspec.json.Decoder()
+        self.session = requests.Session()
+        self.session.headers.update({'Content-Type': 'application/json'})
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=10,
+                              max_retries=Retry(total=3, backoff_factor=0.5))
+        self.session.mount("https://", adapter)
 
     def get_data(self, params):
         result = self.get_from_cache(params)
         if result is not None:
             return result
 
-        response = requests.get(self.etherscan_url, params=params,
-                                headers={'Content-Type': 'application/json'})
-        result = response.json()["result"]
-        self.update_cache(params, result)
-        return result
+        response = self.session.get(self.etherscan_url, params=params)
+        with gc_disabled():
+            result = self.json_decoder.decode(response.content)["result"]
+        return self.update_cache(params, result)
+
+    def is_cacheable(self, params):
+        return (params["module"] == "account"
+                and params["action"] in self.account_actions)
+
+    def get_cache_file(self, params):
+        cache_name = (f"{params['module']}_{params['action']}_"
+                      f"{params['address']}.msgpack")
+        return self.cache_path / cache_name
 
     def get_from_cache(self, params):
-        cache_name = f"{params['module']}_{params['action']}.pkl"
-        cache_path = self.cache_path / cache_name
-        if not cache_path.exists():
+        if not self.is_cacheable(params):
+            return None
+        cache_file = self.get_cache_file(params)
+        if not cache_file.exists():
             return None
-        with open(cache_path, "rb") as f:
-            cache_data = pickle.load(f)
-        if (params["module"] == "account"
-                and params["action"] in self.account_actions):
-            if params["address"] in cache_data:
-                print(f"Found in cache: {params}")
-                return cache_data[params["address"]]
-        return None
+        data = cache_file.read_bytes()
+        with gc_disabled():
+            result = self.decoders[params["action"]].decode(data)
+        if isinstance(result, str):
+            # a cached error message, fetch again
+            return None
+        print(f"Found in cache: {params}")
+        return result
 
     def update_cache(self, params, result):
-        cache_name = f"{params['module']}_{params['action']}.pkl"
-        cache_path = self.cache_path / cache_name
-        if not cache_path.exists():
-            cache_data = {}
-        else:
-            with open(cache_path, "rb") as f:
-                cache_data = pickle.load(f)
-        if (params["module"] == "account"
-                and params["action"] in self.account_actions):
-            cache_data[params["address"]] = result
-        else:
+        if not self.is_cacheable(params):
             print(f"Cannot update cache for {params}")
-        with open(cache_path, "wb") as f:
-            pickle.dump(cache_data, f)
+            return result
+        tx_type = self.account_tx_types[params["action"]]
+        try:
+            records = msgspec.convert(result, list[tx_type] | str)
+        except msgspec.ValidationError as e:
+            # never cache a payload that get_from_cache could not decode
+            raise msgspec.ValidationError(
+                f"Unexpected Etherscan result for {params}: {e}") from e
+        if isinstance(records, str):
+            # Etherscan returns an error message instead of a list
+            raise RuntimeError(f"Etherscan error for {params}: {records}")
+        cache_file = self.get_cache_file(params)
+        # the full response is cached, only the typed fields are kept
+        cache_file.write_bytes(self.encoder.encode(result))
+        return records
@@ -1,19 +1,20 @@
 from dataclasses import dataclass
-from datetime import datetime
+from datetime import datetime, timezone
+import logging
 import pandas as pd
 
-from .etherscan_data import EtherscanData
+from .etherscan_data import EtherscanData, NormalTransaction
 
+logger = logging.getLogger(__name__)
 
-def token_txs_by_tx_hash(eth_data, hash):
-    return [a for a in eth_data.token_txs if a["hash"] == hash]
 
+def txs_by_tx_hash(txs: pd.DataFrame, hash):
+    if hash not in txs.index:
+        return txs.iloc[:0]
+    return txs.loc[[hash]]
 
-def internal_txs_by_tx_hash(eth_data, hash):
-    return [a for a in eth_data.internal_txs if a["hash"] == hash]
 
-
-@dataclass
+@dataclass(slots=True)
 class AssetMovement:
     name: str
     value: float
@@ -22,6 +23,10 @@ class AssetMovement:
 
 
 class TransactionResult:
+    __slots__ = ("hash", "ts", "from_address", "to_address", "contract",
+                 "function", "external", "eth_movements", "tokens_movements",
+                 "error")
+
     def __init__(self, hash: str, ts: int,
                  from_address: str = "", to_address: str = ""):
         self.hash = hash
@@ -47,7 +52,9 @@ class TransactionResult:
 
     @property
     def datetime(self):
-        return datetime.fromtimestamp(self.ts)
+        # naive UTC, like the datetime column of get_summary()
+        return datetime.fromtimestamp(
+            self.ts, tz=timezone.utc).replace(tzinfo=None)
 
 
 class TransactionExplorer:
@@ -60,15 +67,29 @@ class TransactionExplorer:
         self.ds_proxy_data = ds_proxy_data
         self.address_book = address_book
         self.known_contracts = known_contracts
+        self.address_token_txs = self.add_address_names(
+            address_etherscan_data.token_txs_df)
+        self.ds_proxy_token_txs = self.add_address_names(
+            ds_proxy_data.token_txs_df)
+        self.address_internal_txs = self.add_address_names(
+            address_etherscan_data.internal_txs_df)
 
     def get_address_name(self, hash: str):
         return self.address_book.get(hash, hash)
 
+    def add_address_names(self, txs: pd.DataFrame):
+        txs = txs.copy()
+        txs["from_name"] = txs["from_address"].map(
+            self.address_book).fillna(txs["from_address"])
+        txs["to_name"] = txs["to_address"].map(
+            self.address_book).fillna(txs["to_address"])
+        return txs
+
     def make_token_message(self, token_tx):
-        value = float(token_tx["value"]) / 10 ** int(token_tx["tokenDecimal"])
-        token_name = token_tx["tokenName"]
-        token_from = self.get_address_name(token_tx["from"])
-        token_to = self.get_address_name(token_tx["to"])
+        value = float(token_tx.value) / 10 ** int(token_tx.tokenDecimal)
+        token_name = token_tx.tokenName
+        token_from = self.get_address_name(token_tx.from_)
+        token_to = self.get_address_name(token_tx.to)
         if token_from == "ZERO Address":
             return f"{value:.3f} {token_name} minted to {token_to}"
         return f"{value:.3f} {token_name} transferred from {token_from} to {token_to}" # noqa E501
@@ -76,108 +97,119 @@ class TransactionExplorer:
     def contract_explorer(self, contract_hash: str):
         def decorator(func):
             def transaction_explorer(*args, **kwargs):
-                print(f"{self.address_book[contract_hash]} - {contract_hash}")
+                logger.debug("%s - %s",
+                             self.address_book[contract_hash], contract_hash)
                 return func(*args, **kwargs)
             return transaction_explorer
         return decorator
 
-    def process_transaction(self, tx_row: pd.Series, n: int = 0):
-        hash = tx_row["hash"]
-        result = TransactionResult(tx_row["hash"], tx_row["timestamp"])
-        if tx_row["normal"] < 1:
+    def process_transactions(self, data: pd.DataFrame):
+        """Process every get_summary() row, keeping the row order."""
+        results = pd.Series(None, index=data.index, dtype=object)
+        external = data["normal"] < 1
+        external_data = data[external]
+        results[external] = self.process_external_transactions(
+            external_data["hash"], external_data["timestamp"])
+        internal_data = data[~external]
+        results[~external] = [
+            self.process_transaction(tx_row, n)
+            for n, tx_row in zip(
+                internal_data.index,
+                internal_data.itertuples(index=False, name="TxRow"))
+        ]
+        return results.tolist()
+
+    def process_external_transactions(self, hashes, timestamps):
+        results = {}
+        for hash, ts in zip(hashes, timestamps):
+            result = TransactionResult(hash, ts)
             result.external = True
-            token_txs = token_txs_by_tx_hash(self.address_data, tx_row["hash"])
-            for token_tx in token_txs:
-                value = float(token_tx["value"])
-                value = value / 10 ** int(token_tx["tokenDecimal"])
-                token_name = token_tx["tokenSymbol"]
-                token_from = self.get_address_name(token_tx["from"])
-                token_to = self.get_address_name(token_tx["to"])
-                result.add_token_movement(
-                    token_name, value, token_from, token_to)
-            internal_txs = internal_txs_by_tx_hash(
-                self.address_data, tx_row["hash"])
-            for internal_tx in internal_txs:
-                value = float(internal_tx["value"]) / 10 ** 18
-                internal_from = self.get_address_name(internal_tx["from"])
-                internal_to = self.get_address_name(internal_tx["to"])
-                result.add_eth_movement(value, internal_from, internal_to)
-            return result
-        tx = [a for a in self.address_data.txs if a["hash"] == hash][0]
-        result.from_address = self.get_address_name(tx["from"])
-        result.to_address = self.get_address_name(tx["to"])
+            results[hash] = result
+        token_txs = self.address_token_txs
+        token_txs = token_txs[token_txs["hash"].isin(results)]
+        for token_tx in token_txs.itertuples(index=False):
+            results[token_tx.hash].add_token_movement(
+                token_tx.tokenSymbol, token_tx.value_f,
+                token_tx.from_name, token_tx.to_name)
+        internal_txs = self.address_internal_txs
+        internal_txs = internal_txs[internal_txs["hash"].isin(results)]
+        for internal_tx in internal_txs.itertuples(index=False):
+            results[internal_tx.hash].add_eth_movement(
+                internal_tx.value_eth,
+                internal_tx.from_name, internal_tx.to_name)
+        return list(results.values())
+
+    def process_transaction(self, tx_row: tuple, n: int = 0):
+        """tx_row is a get_summary() row from
+        data.itertuples(index=False, name="TxRow")."""
+        hash = tx_row.hash
+        if tx_row.normal < 1:
+            return self.process_external_transactions(
+                [hash], [tx_row.timestamp])[0]
+        result = TransactionResult(tx_row.hash, tx_row.timestamp)
+        tx = self.address_data.txs_by_hash[hash][0]
+        result.from_address = self.get_address_name(tx.from_)
+        result.to_address = self.get_address_name(tx.to)
         # Eth movement
-        if tx["input"] == "0x":
-            value = float(tx["value"]) / 10 ** 18
+        if tx.input == "0x":
+            value = float(tx.value) / 10 ** 18
             result.add_eth_movement(
                 value,
-                self.get_address_name(tx["from"]),
-                self.get_address_name(tx["to"])
+                self.get_address_name(tx.from_),
+                self.get_address_name(tx.to)
                 )
             return result
-        if self.get_address_name(tx["from"]) == "ADDRESS_OF_INTEREST":
-            if tx["to"] not in self.known_contracts:
-                print(f"NEW CONTRACT: {tx['to']}")
+        if self.get_address_name(tx.from_) == "ADDRESS_OF_INTEREST":
+            if tx.to not in self.known_contracts:
+                print(f"NEW CONTRACT: {tx.to}")
                 print(tx)
                 return
             return self.process_contract_transaction(tx_row, tx, result)
         return result
 
-    def process_contract_transaction(self, tx_row: pd.Series, tx: dict,
+    def process_contract_transaction(self, tx_row: tuple,
+                                     tx: NormalTransaction,
                                      result: TransactionResult):
-        contract_name = self.address_book[tx["to"]]
+        contract_name = self.address_book[tx.to]
         result.contract = contract_name
         if contract_name == "Maker: Proxy Registry":
             return result
         # check for ETH sent to contract
-        func_name = tx["functionName"].split("(")[0]
+        func_name = tx.functionName.split("(")[0]
         result.function = func_name
         msg = f"Transaction with {contract_name} - {func_name}:"
-        if int(tx["isError"]) > 0:
+        if int(tx.isError) > 0:
             result.error = True
             return result
-        value = float(tx["value"]) / 10**18
+        value = float(tx.value) / 10**18
         if value > 0:
             msg = "\n".join([msg, f"OUTFLOW ETH {value:0.3f} to DSProxy"])
             result.add_eth_movement(
                 value,
-                self.get_address_name(tx["from"]),
-                self.get_address_name(tx["to"])
+                self.get_address_name(tx.from_),
+                self.get_address_name(tx.to)
                 )
         # token txes
-        token_txs = token_txs_by_tx_hash(self.address_data, tx_row["hash"])
-        internal_txs = internal_txs_by_tx_hash(
-            self.address_data, tx_row["hash"])
-        ds_token_txs = token_txs_by_tx_hash(self.ds_proxy_data, tx_row["hash"])
+        token_txs = txs_by_tx_hash(self.address_token_txs, tx_row.hash)
+        internal_txs = txs_by_tx_hash(self.address_internal_txs,
+                                      tx_row.hash)
+        ds_token_txs = txs_by_tx_hash(self.ds_proxy_token_txs, tx_row.hash)
         if len(token_txs) + len(ds_token_txs) == 0:
             msg = f"{msg} no tokens transactions!"
-        for token_tx in token_txs:
-            value = float(token_tx["value"])
-            value = value / 10 ** int(token_tx["tokenDecimal"])
-            token_name = token_tx["tokenSymbol"]
-            token_from = self.get_address_name(token_tx["from"])
-            token_to = self.get_address_name(token_tx["to"])
+        for token_tx in token_txs.itertuples(index=False):
             result.add_token_movement(
-                token_name, value, token_from, token_to)
+                token_tx.tokenSymbol, token_tx.value_f,
+                token_tx.from_name, token_tx.to_name)
         # Internal txes
-        for internal_tx in internal_txs:
-            value = float(internal_tx["value"]) / 10 ** 18
-            internal_from = self.get_address_name(internal_tx["from"])
-            internal_to = self.get_address_name(internal_tx["to"])
-            result.add_eth_movement(value, internal_from, internal_to)
+        for internal_tx in internal_txs.itertuples(index=False):
+            result.add_eth_movement(internal_tx.value_eth,
+                                    internal_tx.from_name,
+                                    internal_tx.to_name)
         # DSProxy token txes
-        for token_tx in ds_token_txs:
-            value = float(token_tx["value"])
-            value = value / 10 ** int(token_tx["tokenDecimal"])
-            token_name = token_tx["tokenSymbol"]
-            token_from = token_tx["from"]
-            token_to = token_tx["to"]
-            from_address = self.get_address_name(token_from)
-            if from_address == "ADDRESS_OF_INTEREST":
-                continue
-            to_address = self.get_address_name(token_to)
-            if to_address == "ADDRESS_OF_INTEREST":
+        for token_tx in ds_token_txs.itertuples(index=False):
+            if "ADDRESS_OF_INTEREST" in (token_tx.from_name, token_tx.to_name):
                 continue
             result.add_token_movement(
-                token_name, value, from_address, to_address)
+                token_tx.tokenSymbol, token_tx.value_f,
+                token_tx.from_name, token_tx.to_name)
         return result